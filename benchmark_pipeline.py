@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Benchmark do I/O de um scan: cliente sync (pymodbus) x cliente pipeline
+Sobe um servidor Modbus TCP mínimo em localhost e mede o tempo gasto nas
+leituras e escritas de um scan típico do controlador nos dois modos.
+Autor: Sebastião Lopes
+Data: 2026-10-19
+
+Uso:
+    python benchmark_pipeline.py --scans 300 --atraso-ms 1.0
+"""
+
+import argparse
+import queue
+import socket
+import statistics
+import struct
+import threading
+import time
+
+import controlador_fabrica_v_17 as ctl
+
+# Escritas de um scan típico (estado GIRANDO: stack light + esteiras + turntable)
+COILS_SCAN = [
+    ctl.COIL_STACK_LIGHT_RED, ctl.COIL_STACK_LIGHT_GREEN, ctl.COIL_STACK_LIGHT_YELLOW,
+    ctl.COIL_ROLLER_6M_1, ctl.COIL_CONVEYOR_1, ctl.COIL_CONVEYOR_2, ctl.COIL_LOAD_1,
+    ctl.COIL_TURNTABLE_TURN, ctl.COIL_TURNTABLE_ROLL_PLUS, ctl.COIL_TURNTABLE_ROLL_MINUS,
+]
+
+# ============================================================
+# SERVIDOR MODBUS TCP DE TESTE (FC01, FC02 e FC05)
+# ============================================================
+
+class ServidorModbusLocal:
+    """
+    Servidor Modbus TCP mínimo (FC01, FC02 e FC05). Cada resposta sai `atraso` segundos após a
+    chegada da requisição, sem bloquear as seguintes (simula latência de rede).
+    """
+
+    def __init__(self, atraso=0.0):
+        self.atraso = atraso
+        self.coils = {}
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen()
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target=self._aceitar, daemon=True).start()
+
+    def _aceitar(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self._atender, args=(conn,), daemon=True).start()
+
+    def _responder(self, pdu):
+        fc = pdu[0]
+        if fc == 0x01:
+            addr, count = struct.unpack(">HH", pdu[1:5])
+            dados = bytearray((count + 7) // 8)
+            for i in range(count):
+                if self.coils.get(addr + i):
+                    dados[i // 8] |= 1 << (i % 8)
+            return bytes([fc, len(dados)]) + bytes(dados)
+        if fc == 0x02:
+            addr, count = struct.unpack(">HH", pdu[1:5])
+            dados = bytearray((count + 7) // 8)
+            for i in range(count):
+                if (addr + i) % 3 == 0:
+                    dados[i // 8] |= 1 << (i % 8)
+            return bytes([fc, len(dados)]) + bytes(dados)
+        if fc == 0x05:
+            addr, valor = struct.unpack(">HH", pdu[1:5])
+            self.coils[addr] = int(valor == 0xFF00)
+            return pdu
+        return bytes([fc | 0x80, 0x01])
+
+    def _atender(self, conn):
+        saida = queue.Queue()
+
+        def enviar():
+            while True:
+                item = saida.get()
+                if item is None:
+                    return
+                prazo, quadro = item
+                espera = prazo - time.perf_counter()
+                if espera > 0:
+                    time.sleep(espera)
+                try:
+                    conn.sendall(quadro)
+                except OSError:
+                    return
+
+        threading.Thread(target=enviar, daemon=True).start()
+        buffer = b""
+        try:
+            while True:
+                parte = conn.recv(4096)
+                if not parte:
+                    break
+                buffer += parte
+                while len(buffer) >= 7:
+                    tid, proto, tamanho, unit = struct.unpack(">HHHB", buffer[:7])
+                    if len(buffer) < 6 + tamanho:
+                        break
+                    pdu = buffer[7:6 + tamanho]
+                    buffer = buffer[6 + tamanho:]
+                    resposta = self._responder(pdu)
+                    quadro = struct.pack(">HHHB", tid, proto, len(resposta) + 1, unit) + resposta
+                    saida.put((time.perf_counter() + self.atraso, quadro))
+        finally:
+            saida.put(None)
+            conn.close()
+
+    def fechar(self):
+        self.sock.close()
+
+# ============================================================
+# SCAN SIMULADO
+# ============================================================
+
+def scan_sync(client):
+    for addr in ctl.ENTRADAS_SCAN:
+        ctl.read_input(client, addr)
+    for i, coil in enumerate(COILS_SCAN):
+        ctl.write_coil(client, coil, i % 2)
+
+def scan_pipeline(client):
+    ctl.iniciar_scan(client)
+    for addr in ctl.ENTRADAS_SCAN:
+        ctl.read_input(client, addr)
+    for i, coil in enumerate(COILS_SCAN):
+        ctl.write_coil(client, coil, i % 2)
+    ctl.concluir_scan(client)
+
+def medir(nome, client, scan, n_scans):
+    scan(client)  # aquecimento
+    tempos = []
+    for _ in range(n_scans):
+        t0 = time.perf_counter()
+        scan(client)
+        tempos.append((time.perf_counter() - t0) * 1000)
+    tempos.sort()
+    media = statistics.mean(tempos)
+    p95 = tempos[int(0.95 * (len(tempos) - 1))]
+    print(f"{nome:<10} média={media:8.3f} ms  p50={statistics.median(tempos):8.3f} ms  p95={p95:8.3f} ms")
+    return media
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scans", type=int, default=300)
+    parser.add_argument("--atraso-ms", type=float, default=0.0,
+                        help="Atraso por resposta no servidor (simula latência de rede)")
+    args = parser.parse_args()
+
+    servidor = ServidorModbusLocal(atraso=args.atraso_ms / 1000)
+    n_req = len(ctl.ENTRADAS_SCAN) + len(COILS_SCAN)
+    print(f"[BENCH] localhost:{servidor.port} | {n_req} requisições/scan | "
+          f"atraso={args.atraso_ms} ms | {args.scans} scans")
+
+    sync = ctl.connect_modbus("127.0.0.1", servidor.port)
+    pipe = ctl.connect_modbus("127.0.0.1", servidor.port, pipeline=True)
+    try:
+        t_sync = medir("sync", sync, scan_sync, args.scans)
+        t_pipe = medir("pipeline", pipe, scan_pipeline, args.scans)
+        print(f"[BENCH] Ganho: {t_sync / t_pipe:.1f}x")
+    finally:
+        sync.close()
+        pipe.close()
+        servidor.fechar()
+
+if __name__ == "__main__":
+    main()
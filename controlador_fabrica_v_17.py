@@ -11,8 +11,12 @@ Data: 2025-11-12
 import time
 import argparse
 import csv
+import json
 import os
 import re
+import socket
+import struct
+import threading
 # BEGIN: DO NOT MODIFY
 from pymodbus.client.sync import ModbusTcpClient
 # END: DO NOT MODIFY
@@ -122,6 +126,11 @@ UNIT = 1
 DEFAULT_EJECTION_DELAY = 0.5
 DEFAULT_RESUME_DELAY = 0.3
 SCAN_INTERVAL = 0.15
+DEFAULT_SNAPSHOT = "estado_controlador.json"
+CHECKPOINT_INTERVAL = 2.0       # Regrava o snapshot mesmo sem mudanças (idade)
+SNAPSHOT_IDADE_MAXIMA = 60.0    # Snapshot mais antigo que isso é ignorado no warm restart
+FILA_IDADE_MAXIMA = 3 * SCAN_INTERVAL  # Até essa idade a fila é retomada sem ler as coils de volta
+TIMEOUT_TRANSFER_RETOMADA = 10.0  # Espera máxima por At transfer 1 ao retomar uma transferência
 
 # ============================================================
 # MAPEAMENTO RESOLVIDO (geral)
@@ -175,8 +184,159 @@ COIL_STACK_LIGHT_YELLOW = 19   # Stack Light 2 (Yellow)
 # FUNÇÕES MODBUS
 # ============================================================
 
-def connect_modbus(host, port):
-    client = ModbusTcpClient(host, port=port)
+# Entradas lidas de uma só vez no início de cada scan (modo pipeline)
+ENTRADAS_SCAN = [
+    INP_START, INP_STOP, INP_ESTOP,
+    INP_AT_ENTRY_1, INP_AT_TRANSFER_1, INP_AT_TRANSFER_2, INP_AT_EXIT,
+    INP_DIFFUSE_0, INP_DIFFUSE_10, INP_DIFFUSE_11, INP_DIFFUSE_12,
+    INP_TURNTABLE_LIMIT, INP_TURNTABLE_LIMIT_90, INP_TURNTABLE_BACK, INP_TURNTABLE_FRONT,
+] + INPUT_BEAMS
+
+class RespostaPipeline:
+    """Resposta mínima compatível com o uso que o controlador faz do pymodbus"""
+    def __init__(self, bits=None, codigo_excecao=None):
+        self.bits = bits or []
+        self.codigo_excecao = codigo_excecao
+
+    def isError(self):
+        return self.codigo_excecao is not None
+
+class ClienteModbusPipeline:
+    """
+    Cliente Modbus TCP com várias requisições em voo na mesma conexão.
+    As requisições são enviadas juntas e as respostas casadas pelo
+    transaction ID do cabeçalho MBAP, então um lote custa ~1 round trip.
+    - Leituras: iniciar o scan com ler_imagem(); read_discrete_inputs()
+      responde da imagem e só vai ao servidor para endereços fora dela.
+    - Escritas: write_coil() enfileira; enviar_escritas() manda tudo em ordem.
+    """
+
+    def __init__(self, host, port=DEFAULT_PORT, timeout=3.0, max_pendentes=32):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.max_pendentes = max_pendentes  # limite de requisições em voo
+        self.sock = None
+        self.tid = 0
+        self.imagem = {}     # endereço -> bit lido no início do scan
+        self.escritas = []   # (unit, endereço, valor) aguardando envio
+
+    def connect(self):
+        try:
+            self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError:
+            self.sock = None
+            return False
+        return True
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    # ---------- Transporte ----------
+
+    def _proximo_tid(self):
+        self.tid = self.tid % 0xFFFF + 1
+        return self.tid
+
+    def _receber_exato(self, n):
+        dados = b""
+        while len(dados) < n:
+            parte = self.sock.recv(n - len(dados))
+            if not parte:
+                raise ConnectionError("Conexão Modbus encerrada pelo servidor")
+            dados += parte
+        return dados
+
+    def _transacoes(self, requisicoes):
+        """Envia [(unit, pdu), ...] em lotes e devolve os PDUs de resposta na mesma ordem"""
+        if self.sock is None and not self.connect():
+            raise ConnectionError(f"Falha ao conectar a {self.host}:{self.port}")
+        respostas = [None] * len(requisicoes)
+        try:
+            for inicio in range(0, len(requisicoes), self.max_pendentes):
+                pendentes = {}
+                quadros = []
+                for i in range(inicio, min(inicio + self.max_pendentes, len(requisicoes))):
+                    unit, pdu = requisicoes[i]
+                    tid = self._proximo_tid()
+                    pendentes[tid] = i
+                    quadros.append(struct.pack(">HHHB", tid, 0, len(pdu) + 1, unit) + pdu)
+                self.sock.sendall(b"".join(quadros))
+                while pendentes:
+                    tid, _, tamanho, _ = struct.unpack(">HHHB", self._receber_exato(7))
+                    pdu = self._receber_exato(tamanho - 1)
+                    i = pendentes.pop(tid, None)
+                    if i is not None:
+                        respostas[i] = pdu
+        except (OSError, struct.error):
+            # Conexão fica dessincronizada: descarta e reconecta na próxima chamada
+            self.close()
+            raise
+        return respostas
+
+    @staticmethod
+    def _decodificar_bits(pdu, count):
+        if pdu[0] & 0x80:
+            return RespostaPipeline(codigo_excecao=pdu[1])
+        dados = pdu[2:2 + pdu[1]]
+        return RespostaPipeline(bits=[(dados[i // 8] >> (i % 8)) & 1 for i in range(count)])
+
+    # ---------- API usada pelo controlador ----------
+
+    def ler_imagem(self, enderecos, slave=UNIT):
+        """Lê todas as entradas do scan num único lote e guarda a imagem"""
+        self.imagem = {}
+        requisicoes = [(slave, struct.pack(">BHH", 0x02, addr, 1)) for addr in enderecos]
+        for addr, pdu in zip(enderecos, self._transacoes(requisicoes)):
+            rr = self._decodificar_bits(pdu, 1)
+            if not rr.isError():
+                self.imagem[addr] = rr.bits[0]
+
+    def descartar_imagem(self):
+        self.imagem = {}
+
+    def read_discrete_inputs(self, address, count=1, slave=UNIT):
+        if count == 1 and address in self.imagem:
+            return RespostaPipeline(bits=[self.imagem[address]])
+        pdu = self._transacoes([(slave, struct.pack(">BHH", 0x02, address, count))])[0]
+        return self._decodificar_bits(pdu, count)
+
+    def read_coils(self, address, count=1, slave=UNIT):
+        pdu = self._transacoes([(slave, struct.pack(">BHH", 0x01, address, count))])[0]
+        return self._decodificar_bits(pdu, count)
+
+    def write_coil(self, address, value, slave=UNIT):
+        self.escritas.append((slave, address, value))
+
+    def enviar_escritas(self):
+        """
+        Envia todas as escritas enfileiradas num único lote (ordem preservada).
+        Se o envio falhar, elas voltam para o início da fila e saem no próximo
+        envio (FC05 é idempotente); só o último valor de cada coil é mantido.
+        """
+        escritas, self.escritas = self.escritas, []
+        if not escritas:
+            return
+        requisicoes = [(unit, struct.pack(">BHH", 0x05, addr, 0xFF00 if value else 0x0000))
+                       for unit, addr, value in escritas]
+        try:
+            self._transacoes(requisicoes)
+        except Exception:
+            ultimas = {}
+            for unit, addr, value in escritas + self.escritas:
+                ultimas.pop((unit, addr), None)
+                ultimas[(unit, addr)] = value
+            self.escritas = [(unit, addr, value) for (unit, addr), value in ultimas.items()]
+            raise
+
+def connect_modbus(host, port, pipeline=False):
+    if pipeline:
+        client = ClienteModbusPipeline(host, port=port)
+    else:
+        client = ModbusTcpClient(host, port=port)
     if not client.connect():
         raise ConnectionError(f"Falha ao conectar a {host}:{port}")
     return client
@@ -196,6 +356,28 @@ def write_coil(client, address, value):
     except Exception:
         pass
 
+def iniciar_scan(client):
+    """Modo pipeline: lê a imagem de entradas do scan em um único round trip"""
+    if isinstance(client, ClienteModbusPipeline):
+        try:
+            client.ler_imagem(ENTRADAS_SCAN)
+        except Exception as e:
+            print(f"[MODBUS] Falha ao ler entradas do scan: {e}")
+
+def concluir_scan(client):
+    """Modo pipeline: envia juntas as escritas acumuladas durante o scan"""
+    if isinstance(client, ClienteModbusPipeline):
+        try:
+            client.enviar_escritas()
+        except Exception as e:
+            print(f"[MODBUS] Falha ao enviar escritas ({len(client.escritas)} na fila para reenvio): {e}")
+
+def sincronizar(client):
+    """Modo pipeline: aplica escritas pendentes e força leituras ao vivo até o próximo scan"""
+    if isinstance(client, ClienteModbusPipeline):
+        concluir_scan(client)
+        client.descartar_imagem()
+
 # ============================================================
 # FUNÇÕES DE SISTEMA (desligar/ligar esteiras/emissores etc.)
 # ============================================================
@@ -442,22 +624,305 @@ def controlar_turntable(client, fila_caixas, timeout_align=10.0, timeout_eject=1
 # TRANSFERÊNCIA 2->1
 # ============================================================
 
-def transferencia_2_para_1(client, sensores, delay, resume):
+# Progresso da transferência (persistido no snapshot para o warm restart)
+TRANSFER_STATE = {
+    'em_andamento': False
+}
+
+def concluir_transferencia(client, resume, ao_mudar=None, timeout=None):
+    """
+    Aguarda a caixa chegar em At transfer 1, desliga a transferência e religa a linha.
+    Com timeout, retorna False (transferência desligada, linha não religada) se a caixa não chegar.
+    """
+    inicio = time.time()
+    chegou = True
+    while not read_input(client, INP_AT_TRANSFER_1):
+        if timeout is not None and time.time() - inicio > timeout:
+            chegou = False
+            break
+        time.sleep(0.05)
+    write_coil(client, COIL_TRANSFER_LEFT_1, 0)
+    write_coil(client, COIL_TRANSFER_LEFT_2, 0)
+    sincronizar(client)
+    TRANSFER_STATE['em_andamento'] = False
+    if ao_mudar:
+        ao_mudar()
+    if not chegou:
+        print(f"[TRANSFER] Caixa não chegou em At transfer 1 em {timeout:.0f} s")
+        return False
+    time.sleep(resume)
+    ligar_esteiras_e_loads(client)
+    ligar_emissores(client)
+    return True
+
+def transferencia_2_para_1(client, sensores, delay, resume, ao_mudar=None):
     at_entry_1, at_transfer_1, at_transfer_2, at_exit = sensores
     # Só ativa transferência se at_transfer_2 está ON e TODOS os outros sensores estão OFF
     if at_transfer_2 and not at_exit and not at_entry_1 and not at_transfer_1:
+        # Marca antes de ligar as coils: o snapshot nunca diz "sem transferência" com elas ligadas
+        TRANSFER_STATE['em_andamento'] = True
+        if ao_mudar:
+            ao_mudar()
         for c in [COIL_CONVEYOR_1, COIL_CONVEYOR_2, COIL_EMITTER_1, COIL_EMITTER_2]:
             write_coil(client, c, 0)
         write_coil(client, COIL_TRANSFER_LEFT_1, 1)
         write_coil(client, COIL_TRANSFER_LEFT_2, 1)
+        sincronizar(client)
         time.sleep(delay)
-        while not read_input(client, INP_AT_TRANSFER_1):
-            time.sleep(0.05)
+        concluir_transferencia(client, resume, ao_mudar)
+
+# ============================================================
+# SNAPSHOT DE ESTADO (WARM RESTART)
+# ============================================================
+
+ESTADOS_TURNTABLE = ('IDLE', 'LOADING', 'POSICIONADO', 'GIRANDO', 'EJETANDO', 'RETORNANDO')
+CAMPOS_SNAPSHOT = [
+    ('salvo_em',), ('sistema_ativo',), ('estop_ativo',), ('fila_caixas',),
+    ('transferencia_em_andamento',),
+    ('turntable', 'estado'), ('turntable', 'caixa_atual'),
+    ('turntable', 'direcao'), ('turntable', 'contador_giro'),
+    ('medicao', 'sensor_passagem_anterior'), ('medicao', 'altura_maxima_atual'),
+]
+# Saídas que trazem caixas pelos beams: se ficaram ligadas com o controlador fora, a fila não vale mais
+COILS_ALIMENTACAO = [
+    COIL_EMITTER_1, COIL_EMITTER_2, COIL_LOAD_1, COIL_LOAD_2,
+    COIL_CONVEYOR_1, COIL_CONVEYOR_2, COIL_ROLLER_4M_0, COIL_ROLLER_4M_3,
+]
+VERSAO_SNAPSHOT = 1
+
+def caminhos_snapshot(caminho):
+    """Os dois arquivos do buffer duplo: estado.json -> estado.a.json / estado.b.json"""
+    base, ext = os.path.splitext(caminho)
+    return [f"{base}.a{ext}", f"{base}.b{ext}"]
+
+def capturar_estado(sistema_ativo, estop_ativo, fila_caixas, sensor_passagem_anterior, altura_maxima_atual):
+    """Cópia do estado do controlador (só dados, sem referências às estruturas vivas)"""
+    return {
+        'versao': VERSAO_SNAPSHOT,
+        'sistema_ativo': sistema_ativo,
+        'estop_ativo': estop_ativo,
+        'turntable': {
+            'estado': TURNTABLE_STATE['estado'],
+            'caixa_atual': TURNTABLE_STATE['caixa_atual'],
+            'direcao': TURNTABLE_STATE.get('direcao'),
+            'contador_giro': TURNTABLE_STATE['contador_giro'],
+        },
+        'fila_caixas': list(fila_caixas),
+        'transferencia_em_andamento': TRANSFER_STATE['em_andamento'],
+        'medicao': {
+            'sensor_passagem_anterior': sensor_passagem_anterior,
+            'altura_maxima_atual': altura_maxima_atual,
+        },
+    }
+
+def gravar_atomico(caminho, dados):
+    """Grava em .tmp, faz fsync e renomeia: o arquivo nunca fica pela metade"""
+    tmp = caminho + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(dados, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, caminho)
+
+def carregar_snapshot(caminho):
+    """Lê os dois arquivos do buffer duplo e devolve o snapshot íntegro mais recente (ou None)"""
+    melhor = None
+    for arquivo in caminhos_snapshot(caminho):
+        try:
+            with open(arquivo, encoding="utf-8") as f:
+                dados = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if not isinstance(dados, dict) or dados.get('versao') != VERSAO_SNAPSHOT:
+            continue
+        if melhor is None or dados.get('seq', 0) > melhor.get('seq', 0):
+            melhor = dados
+    return melhor
+
+class GravadorSnapshot:
+    """
+    Grava checkpoints do controlador numa thread própria, sem custo de disco no scan.
+    - Em memória: o scan só troca a referência do snapshot pendente; a thread
+      grava sempre o mais recente (intermediários são descartados).
+    - Em disco: alterna entre os dois arquivos de caminhos_snapshot(), então
+      um crash durante a gravação ainda deixa o checkpoint anterior íntegro.
+    """
+
+    def __init__(self, caminho, intervalo=CHECKPOINT_INTERVAL):
+        self.caminhos = caminhos_snapshot(caminho)
+        self.intervalo = intervalo
+        anterior = carregar_snapshot(caminho)
+        self.seq = anterior.get('seq', 0) if anterior else 0
+        self.ultimo = None
+        self.ultimo_envio = 0.0
+        self.pendente = None
+        self.ativo = True
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._gravar_loop, daemon=True)
+        self.thread.start()
+
+    def checkpoint(self, snapshot):
+        """Chamado a cada scan: só enfileira se o estado mudou ou o intervalo venceu"""
+        agora = time.time()
+        if snapshot == self.ultimo and agora - self.ultimo_envio < self.intervalo:
+            return
+        self.ultimo = snapshot
+        self.ultimo_envio = agora
+        with self.cond:
+            self.pendente = snapshot
+            self.cond.notify()
+
+    def _gravar_loop(self):
+        while True:
+            with self.cond:
+                while self.pendente is None and self.ativo:
+                    self.cond.wait()
+                if self.pendente is None:
+                    return
+                snapshot, self.pendente = self.pendente, None
+            self.seq += 1
+            destino = self.caminhos[self.seq % 2]
+            try:
+                gravar_atomico(destino, dict(snapshot, seq=self.seq, salvo_em=time.time()))
+            except OSError as e:
+                print(f"[SNAPSHOT] Falha ao gravar '{destino}': {e}")
+
+    def fechar(self):
+        """Grava o último snapshot pendente e encerra a thread"""
+        with self.cond:
+            self.ativo = False
+            self.cond.notify()
+        self.thread.join(timeout=5.0)
+
+def validar_snapshot(client, snapshot):
+    """
+    Confere o snapshot contra os sensores reais antes de retomar.
+    GIRANDO/EJETANDO com a mesa de volta em 0° e a caixa sobre ela viram POSICIONADO.
+    Retorna (ok, motivo).
+    """
+    if snapshot is None:
+        return False, "nenhum snapshot encontrado"
+    try:
+        for campo in CAMPOS_SNAPSHOT:
+            valor = snapshot
+            for chave in campo:
+                valor = valor[chave]
+        if not isinstance(snapshot['fila_caixas'], list):
+            return False, "snapshot incompleto"
+        tt = snapshot['turntable']
+        inteiros = snapshot['fila_caixas'] + [
+            snapshot['medicao']['sensor_passagem_anterior'],
+            snapshot['medicao']['altura_maxima_atual'],
+            tt['contador_giro'],
+        ]
+        if tt['caixa_atual'] is not None:
+            inteiros.append(tt['caixa_atual'])
+        if not all(isinstance(v, int) for v in inteiros):
+            return False, "snapshot com valores inválidos"
+        idade = time.time() - snapshot['salvo_em']
+        if idade > SNAPSHOT_IDADE_MAXIMA:
+            return False, f"snapshot antigo ({idade:.0f} s)"
+        if not snapshot['sistema_ativo'] or snapshot['estop_ativo']:
+            return False, "sistema estava parado"
+        estado = snapshot['turntable']['estado']
+        if estado not in ESTADOS_TURNTABLE:
+            return False, f"estado desconhecido '{estado}'"
+    except (KeyError, TypeError):
+        return False, "snapshot incompleto"
+
+    limit_0 = read_input(client, INP_TURNTABLE_LIMIT)
+    limit_90 = read_input(client, INP_TURNTABLE_LIMIT_90)
+    front_limit = read_input(client, INP_TURNTABLE_FRONT)
+    back_limit = read_input(client, INP_TURNTABLE_BACK)
+    caixa_na_mesa = front_limit or back_limit
+
+    # Parada limpa solta o Turn (desligar_tudo): a mesa volta a 0° com a caixa, então gira de novo
+    if estado in ('GIRANDO', 'EJETANDO') and limit_0 and caixa_na_mesa:
+        print(f"[SNAPSHOT] {estado} com turntable em 0° e caixa sobre a mesa: retomando como POSICIONADO")
+        estado = 'POSICIONADO'
+        tt['estado'] = estado
+        tt['direcao'] = None
+
+    if estado in ('IDLE', 'LOADING', 'POSICIONADO') and not limit_0:
+        return False, f"{estado}: turntable fora da posição 0°"
+    if estado == 'GIRANDO' and limit_0:
+        return False, f"{estado}: turntable parado na posição 0°"
+    if estado == 'EJETANDO' and not limit_90:
+        return False, f"{estado}: turntable fora da posição 90°"
+    if estado in ('POSICIONADO', 'GIRANDO') and not caixa_na_mesa:
+        return False, f"{estado}: nenhuma caixa sobre o turntable"
+    if estado == 'RETORNANDO' and caixa_na_mesa:
+        return False, f"{estado}: caixa inesperada sobre o turntable"
+
+    if snapshot['transferencia_em_andamento']:
+        at_transfer_1 = read_input(client, INP_AT_TRANSFER_1)
+        at_transfer_2 = read_input(client, INP_AT_TRANSFER_2)
+        if not at_transfer_1 and not at_transfer_2:
+            return False, "transferência em andamento, mas nenhuma caixa na zona de transferência"
+    return True, ""
+
+def fila_confiavel(client, snapshot):
+    """
+    A fila só vale se nenhuma caixa passou pelos beams sem ser medida: snapshot de
+    poucos scans atrás, ou esteiras/emissores lidos de volta (FC01) todos desligados.
+    Falha de leitura conta como ligada.
+    """
+    if time.time() - snapshot['salvo_em'] <= FILA_IDADE_MAXIMA:
+        return True
+    for coil in COILS_ALIMENTACAO:
+        try:
+            rr = client.read_coils(address=coil, count=1, slave=UNIT)
+            if rr.isError() or rr.bits[0]:
+                return False
+        except Exception:
+            return False
+    return True
+
+def restaurar_snapshot(client, snapshot, resume, ao_mudar=None):
+    """
+    Recarrega TURNTABLE_STATE/TRANSFER_STATE e religa as saídas que o ciclo mantém ligadas.
+    Retorna False se a transferência retomada não concluir (exige partida normal).
+    """
+    tt = snapshot['turntable']
+    TURNTABLE_STATE['estado'] = tt['estado']
+    TURNTABLE_STATE['caixa_atual'] = tt['caixa_atual']
+    TURNTABLE_STATE['contador_giro'] = tt['contador_giro']
+    TURNTABLE_STATE['timestamp'] = time.time()
+    TURNTABLE_STATE.pop('direcao', None)
+    if tt['direcao'] is not None:
+        TURNTABLE_STATE['direcao'] = tt['direcao']
+
+    # A máquina de estados reescreve turntable/stack light a cada scan; aqui só
+    # religamos o que ela não controla (ou que só liga ao voltar para IDLE)
+    if tt['estado'] in ('IDLE', 'LOADING'):
+        coils_ligados = [COIL_LOAD_1, COIL_LOAD_2, COIL_CONVEYOR_1, COIL_CONVEYOR_2,
+                         COIL_ROLLER_4M_0, COIL_ROLLER_4M_3, COIL_ROLLER_6M_1]
+    else:
+        coils_ligados = [COIL_LOAD_2, COIL_ROLLER_4M_0, COIL_ROLLER_4M_3]
+
+    if not snapshot['transferencia_em_andamento']:
+        # Sem desligar_tudo() as coils guardam o valor do processo anterior: a
+        # transferência pode ter ficado ligada e a máquina de estados não a desliga
         write_coil(client, COIL_TRANSFER_LEFT_1, 0)
         write_coil(client, COIL_TRANSFER_LEFT_2, 0)
-        time.sleep(resume)
-        ligar_esteiras_e_loads(client)
-        ligar_emissores(client)
+        for coil in coils_ligados + [COIL_EMITTER_1, COIL_EMITTER_2]:
+            write_coil(client, coil, 1)
+        return True
+
+    # Transferência pendente: esteiras 1/2 e emissores ficam desligados até ela concluir
+    print("[SNAPSHOT] Retomando transferência 2->1 em andamento")
+    TRANSFER_STATE['em_andamento'] = True
+    if ao_mudar:
+        ao_mudar()
+    for c in [COIL_CONVEYOR_1, COIL_CONVEYOR_2, COIL_EMITTER_1, COIL_EMITTER_2]:
+        write_coil(client, c, 0)
+    for coil in coils_ligados:
+        if coil not in (COIL_CONVEYOR_1, COIL_CONVEYOR_2):
+            write_coil(client, coil, 1)
+    write_coil(client, COIL_TRANSFER_LEFT_1, 1)
+    write_coil(client, COIL_TRANSFER_LEFT_2, 1)
+    sincronizar(client)
+    return concluir_transferencia(client, resume, ao_mudar, timeout=TIMEOUT_TRANSFER_RETOMADA)
 
 # ============================================================
 # LOOP PRINCIPAL INTEGRADO
@@ -467,12 +932,17 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--host", default=DEFAULT_HOST)
     parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Envia as requisições do scan juntas (várias transações em voo)")
+    parser.add_argument("--snapshot", default=DEFAULT_SNAPSHOT,
+                        help="Arquivo base dos checkpoints de estado ('' desativa)")
+    parser.add_argument("--warm-restart", action="store_true",
+                        help="Retoma do último snapshot se ele bater com os sensores")
     args = parser.parse_args()
 
-    client = connect_modbus(args.host, args.port)
-    desligar_tudo(client)
-    print(f"[SISTEMA] Conectado a {args.host}:{args.port}")
-    print(f"[SISTEMA] Aguardando START...\n")
+    client = connect_modbus(args.host, args.port, pipeline=args.pipeline)
+    modo = "pipeline" if args.pipeline else "sync"
+    print(f"[SISTEMA] Conectado a {args.host}:{args.port} (cliente {modo})")
 
     # Estados do sistema
     sistema_ativo = False
@@ -486,8 +956,52 @@ def main():
     sensor_passagem_anterior = 0
     altura_maxima_atual = 0
 
+    # Warm restart: retoma o ciclo do ponto salvo em vez de esvaziar a linha
+    snapshot = None
+    if args.warm_restart and args.snapshot:
+        snapshot = carregar_snapshot(args.snapshot)
+        ok, motivo = validar_snapshot(client, snapshot)
+        if not ok:
+            print(f"[SNAPSHOT] Warm restart descartado: {motivo}")
+            snapshot = None
+
+    if snapshot:
+        sistema_ativo = True
+        if fila_confiavel(client, snapshot):
+            fila_caixas = list(snapshot['fila_caixas'])
+            sensor_passagem_anterior = snapshot['medicao']['sensor_passagem_anterior']
+            altura_maxima_atual = snapshot['medicao']['altura_maxima_atual']
+        else:
+            print("[SNAPSHOT] Esteiras/emissores ficaram ligados sem o controlador: fila de caixas descartada")
+
+    gravador = GravadorSnapshot(args.snapshot) if args.snapshot else None
+
+    def checkpoint():
+        if gravador:
+            gravador.checkpoint(capturar_estado(sistema_ativo, estop_ativo, fila_caixas,
+                                                sensor_passagem_anterior, altura_maxima_atual))
+
     try:
+        if snapshot:
+            print(f"[SNAPSHOT] Retomando: turntable {snapshot['turntable']['estado']} "
+                  f"(caixa {snapshot['turntable']['caixa_atual']}) | Fila: {fila_caixas}\n")
+            if not restaurar_snapshot(client, snapshot, DEFAULT_RESUME_DELAY, ao_mudar=checkpoint):
+                print("[SNAPSHOT] Warm restart abortado: partida normal")
+                sistema_ativo = False
+                fila_caixas.clear()
+                sensor_passagem_anterior = 0
+                altura_maxima_atual = 0
+                TURNTABLE_STATE.update(estado='IDLE', caixa_atual=None, timestamp=0, contador_giro=0)
+                TURNTABLE_STATE.pop('direcao', None)
+                snapshot = None
+        if not snapshot:
+            desligar_tudo(client)
+            sincronizar(client)
+            print(f"[SISTEMA] Aguardando START...\n")
+
         while True:
+            iniciar_scan(client)
+
             # Lê botões
             start = read_input(client, INP_START)
             stop = read_input(client, INP_STOP)
@@ -558,17 +1072,23 @@ def main():
 
                 # transferências e controle
                 sensores = (at_entry_1, at_transfer_1, at_transfer_2, at_exit)
-                transferencia_2_para_1(client, sensores, DEFAULT_EJECTION_DELAY, DEFAULT_RESUME_DELAY)
+                transferencia_2_para_1(client, sensores, DEFAULT_EJECTION_DELAY, DEFAULT_RESUME_DELAY,
+                                       ao_mudar=checkpoint)
 
                 # lógica do turntable integrado (auto-alimentação + ciclo de rotação)
                 controlar_turntable(client, fila_caixas)
 
+            checkpoint()
+            concluir_scan(client)
             time.sleep(SCAN_INTERVAL)
 
     except KeyboardInterrupt:
         print("\n[SISTEMA] Encerrado")
     finally:
+        if gravador:
+            gravador.fechar()
         desligar_tudo(client)
+        sincronizar(client)
         client.close()
 
 if __name__ == "__main__":